@@ -30,11 +30,18 @@ CREATE TABLE IF NOT EXISTS courses (
 
 CREATE TABLE IF NOT EXISTS horses (
     horse_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nom TEXT UNIQUE,
+    nom TEXT,
     age INTEGER,
-    sexe TEXT
+    sexe TEXT,
+    annee_naissance INTEGER,
+    pere TEXT,
+    mere TEXT,
+    proprietaire TEXT,
+    eleveur TEXT
 );
 
+CREATE INDEX IF NOT EXISTS idx_horses_nom ON horses(nom);
+
 CREATE TABLE IF NOT EXISTS trainers (
     trainer_id INTEGER PRIMARY KEY AUTOINCREMENT,
     nom TEXT UNIQUE
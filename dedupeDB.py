@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import sys
+import time
+
+# === CONFIG ===
+DB_FILE = "pmu.sqlite"
+
+# Clé naturelle d'une course : on garde les colonnes présentes dans la BD
+# (v2 : hippodrome_id, v1 : hippodrome / reunion)
+COURSE_KEY_CANDIDATES = ["date", "reunion", "hippodrome_id", "hippodrome", "course_externe", "heure_depart"]
+
+
+# -------------------- HELPERS -------------------- #
+def columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [info[1] for info in cur.fetchall()]
+
+
+def fmt_size(n):
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} To"
+
+
+def course_key(cur):
+    """Colonnes de la clé naturelle présentes dans la table courses."""
+    existing = columns(cur, "courses")
+    return [c for c in COURSE_KEY_CANDIDATES if c in existing]
+
+
+def keyed_courses(key):
+    """
+    (source, colonnes de partition) des courses pour la clé naturelle. Les courses migrées
+    de v1 n'ont pas d'heure de départ : NULL vaut n'importe quelle heure, il prend celle des
+    autres copies de la course quand elles sont toutes d'accord.
+    """
+    if "heure_depart" not in key:
+        return "courses", key
+    others = ", ".join(c for c in key if c != "heure_depart")
+    source = f"""(
+        SELECT *,
+               COALESCE(heure_depart,
+                        CASE WHEN MIN(heure_depart) OVER k = MAX(heure_depart) OVER k
+                             THEN MIN(heure_depart) OVER k END) AS depart
+        FROM courses
+        WINDOW k AS (PARTITION BY {others})
+    )"""
+    return source, ["depart" if c == "heure_depart" else c for c in key]
+
+
+# -------------------- DEDUPLICATION -------------------- #
+def map_duplicate_courses(cur, key):
+    """
+    Remplit course_map(old_id -> keep_id) pour toutes les courses en double.
+    On garde la copie la plus complète (durée connue), puis la plus récente.
+    """
+    source, partition = keyed_courses(key)
+    key_sql = ", ".join(partition)
+    order = "duree IS NULL, course_id DESC" if "duree" in columns(cur, "courses") else "course_id DESC"
+    cur.execute("DROP TABLE IF EXISTS temp.course_map")
+    cur.execute(f"""
+        CREATE TEMP TABLE course_map AS
+        SELECT course_id AS old_id, keep_id FROM (
+            SELECT course_id,
+                   FIRST_VALUE(course_id) OVER (PARTITION BY {key_sql} ORDER BY {order}) AS keep_id
+            FROM {source}
+        )
+        WHERE course_id != keep_id
+    """)
+    cur.execute("CREATE UNIQUE INDEX temp.course_map_old ON course_map(old_id)")
+    cur.execute("SELECT COUNT(*) FROM course_map")
+    return cur.fetchone()[0]
+
+
+def remap_participants(cur):
+    """Rattache les participants des courses en double à la course conservée."""
+    cur.execute("""
+        UPDATE participants
+        SET course_id = (SELECT keep_id FROM course_map WHERE old_id = participants.course_id)
+        WHERE course_id IN (SELECT old_id FROM course_map)
+    """)
+    return cur.rowcount
+
+
+def delete_duplicate_courses(cur):
+    cur.execute("DELETE FROM courses WHERE course_id IN (SELECT old_id FROM course_map)")
+    return cur.rowcount
+
+
+def delete_orphan_participants(cur):
+    """Participants dont la course n'existe plus (ou n'a jamais existé)."""
+    cur.execute("""
+        DELETE FROM participants
+        WHERE course_id IS NULL
+           OR NOT EXISTS (SELECT 1 FROM courses c WHERE c.course_id = participants.course_id)
+    """)
+    return cur.rowcount
+
+
+def delete_duplicate_participants(cur):
+    """
+    Un cheval ne court qu'une fois par course : on garde la copie avec une arrivée connue,
+    puis la plus récente. Sans cheval (participants migrés de v1), un driver ne monte
+    qu'un partant par course : clé (course, driver, entraîneur). Sans driver non plus,
+    la ligne n'est pas fusionnée.
+    """
+    cur.execute("""
+        DELETE FROM participants
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY course_id, horse_id,
+                                        CASE WHEN horse_id IS NULL THEN COALESCE(driver_id, -id) END,
+                                        CASE WHEN horse_id IS NULL THEN trainer_id END
+                           ORDER BY ordreArrivee IS NULL, id DESC
+                       ) AS rn
+                FROM participants
+            )
+            WHERE rn > 1
+        )
+    """)
+    return cur.rowcount
+
+
+# -------------------- MAIN -------------------- #
+def dedupe(db_file):
+    if not os.path.exists(db_file):
+        print(f"[ERROR] {db_file} introuvable")
+        return
+
+    t0 = time.time()
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    cur = conn.cursor()
+
+    size_before = os.path.getsize(db_file)
+    key = course_key(cur)
+    print(f"=== Dédoublonnage de {db_file} ({fmt_size(size_before)}) ===")
+    print(f"Clé naturelle des courses : {', '.join(key)}")
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        n_dup = map_duplicate_courses(cur, key)
+        print(f"  -> {n_dup} courses en double")
+        print(f"  -> {remap_participants(cur)} participants rattachés à la course conservée")
+        print(f"  -> {delete_duplicate_courses(cur)} courses supprimées")
+        print(f"  -> {delete_orphan_participants(cur)} participants orphelins supprimés")
+        print(f"  -> {delete_duplicate_participants(cur)} participants en double supprimés")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+    print("Reconstruction de la BD (VACUUM)...")
+    cur.execute("VACUUM")
+    conn.close()
+
+    size_after = os.path.getsize(db_file)
+    print(f"\nTaille : {fmt_size(size_before)} -> {fmt_size(size_after)} "
+          f"({fmt_size(size_before - size_after)} récupérés) en {time.time() - t0:.1f}s ✅")
+
+
+def main():
+    db_file = sys.argv[1] if len(sys.argv) > 1 else DB_FILE
+    dedupe(db_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Identité des chevaux (nom + année de naissance / généalogie), partagée par v2APIscrap
+# et v1APIscrap. N'ouvre aucune connexion : chaque scraper passe la sienne.
+
+# -------------------- IDENTITE DES CHEVAUX -------------------- #
+# Attributs stables : deux homonymes sont le même cheval si aucun de ceux-ci ne diffère.
+# Le propriétaire change au fil des ventes, il ne sert qu'à départager. Le sexe peut passer
+# de MALES à HONGRES (castration) : seul femelle / non femelle est comparé.
+HORSE_IDENTITY = ("annee_naissance", "pere", "mere", "eleveur")
+HORSE_COLUMNS = HORSE_IDENTITY + ("proprietaire",)
+
+def norm_nom(nom):
+    if isinstance(nom, dict):
+        nom = nom.get("nom") or nom.get("name")
+    if not nom or not isinstance(nom, str):
+        return None
+    return " ".join(nom.upper().split())
+
+def femelle(sexe):
+    if not sexe:
+        return None
+    return sexe.upper().startswith("FEMELLE")
+
+def birth_year(age, date_str):
+    """L'âge PMU change au 1er janvier : année de naissance = année de la course - âge."""
+    if age is None or not date_str:
+        return None
+    try:
+        return int(date_str[4:8]) - int(age)
+    except ValueError:
+        return None
+
+def load_horse_index(conn, where=""):
+    """nom normalisé -> liste des chevaux portant ce nom."""
+    index = {}
+    cur = conn.cursor()
+    cur.execute(f"SELECT horse_id, nom, sexe, {', '.join(HORSE_COLUMNS)} FROM horses {where}")
+    for row in cur.fetchall():
+        horse = dict(zip(HORSE_COLUMNS, row[3:]))
+        horse["horse_id"] = row[0]
+        horse["femelle"] = femelle(row[2])
+        index.setdefault(norm_nom(row[1]), []).append(horse)
+    return index
+
+def match_horse(candidates, attrs, fem=None):
+    """Candidat compatible ayant le plus d'attributs en commun (None si aucun)."""
+    best, best_score = None, -1
+    for horse in candidates:
+        if fem is not None and horse["femelle"] is not None and fem != horse["femelle"]:
+            continue
+        score = 0
+        for col in HORSE_IDENTITY:
+            if attrs[col] is None or horse[col] is None:
+                continue
+            if attrs[col] != horse[col]:
+                break
+            score += 2
+        else:
+            if attrs["proprietaire"] is not None and attrs["proprietaire"] == horse["proprietaire"]:
+                score += 1
+            if score > best_score:
+                best, best_score = horse, score
+    return best
+
+def resolve_horse(conn, index, nom, age, sexe, date_str, pere, mere, proprietaire, eleveur):
+    """Cherche le cheval dans l'index en mémoire, le complète ou le crée."""
+    cur = conn.cursor()
+    attrs = {
+        "annee_naissance": birth_year(age, date_str),
+        "pere": norm_nom(pere),
+        "mere": norm_nom(mere),
+        "eleveur": norm_nom(eleveur),
+        "proprietaire": norm_nom(proprietaire),
+    }
+    fem = femelle(sexe)
+    candidates = index.setdefault(norm_nom(nom), [])
+    horse = match_horse(candidates, attrs, fem)
+    if horse:
+        # on complète ce qui manquait (chevaux créés avant l'index ou sans généalogie)
+        missing = {col: v for col, v in attrs.items() if v is not None and horse[col] is None}
+        if fem is not None and horse["femelle"] is None:
+            cur.execute("UPDATE horses SET sexe=? WHERE horse_id=?", (sexe, horse["horse_id"]))
+            horse["femelle"] = fem
+        if missing:
+            sets = ", ".join(f"{col}=?" for col in missing)
+            cur.execute(f"UPDATE horses SET {sets} WHERE horse_id=?",
+                        (*missing.values(), horse["horse_id"]))
+            horse.update(missing)
+        conn.commit()
+        return horse["horse_id"]
+
+    cur.execute(f"""INSERT INTO horses (nom, age, sexe, {', '.join(HORSE_COLUMNS)})
+                VALUES (?, ?, ?, {', '.join('?' * len(HORSE_COLUMNS))})""",
+                (nom, age, sexe, *(attrs[col] for col in HORSE_COLUMNS)))
+    conn.commit()
+    candidates.append({**attrs, "horse_id": cur.lastrowid, "femelle": fem})
+    return cur.lastrowid
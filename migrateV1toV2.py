@@ -0,0 +1,301 @@
+import os
+import sqlite3
+import sys
+import time
+
+from schemaV2 import SCHEMA, upgrade_horses
+
+# === CONFIG ===
+V1_DB = "pmu_full.db"
+V2_DB = "pmu.sqlite"
+CHUNK_DAYS = 30  # journées migrées par transaction
+
+# v1 stocke les dates en ddmmyyyy : clé triable yyyymmdd
+SORT_KEY = "(substr({col}, 5, 4) || substr({col}, 3, 2) || substr({col}, 1, 2))"
+# course_externe v1 "C3" -> v2 "3"
+COURSE_EXTERNE = "(CASE WHEN c.course_externe LIKE 'C%' THEN substr(c.course_externe, 2) ELSE c.course_externe END)"
+
+
+# -------------------- SETUP -------------------- #
+def setup(conn, v1_file):
+    cur = conn.cursor()
+    cur.executescript(SCHEMA)
+    upgrade_horses(conn)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS migration_v1 (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_date TEXT
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO migration_v1 (id, last_date) VALUES (1, NULL)")
+    conn.commit()
+
+    cur.execute("PRAGMA temp_store = MEMORY")
+    cur.execute("ATTACH DATABASE ? AS v1", (v1_file,))
+    # seul ajout fait à la base v1 : sans cet index, chaque bloc relit toute la table participants
+    cur.execute("CREATE INDEX IF NOT EXISTS v1.idx_participants_course ON participants(course_id)")
+
+    # v1 récent : chevaux identifiés par nom + attributs ; ancien v1 : colonnes absentes (NULL)
+    cur.execute("PRAGMA v1.table_info(horses)")
+    v1_columns = [info[1] for info in cur.fetchall()]
+    identity = ", ".join(col if col in v1_columns else f"NULL AS {col}"
+                         for col in ("annee_naissance", "pere", "mere", "proprietaire", "eleveur"))
+    cur.execute("DROP VIEW IF EXISTS temp.v1_horses")
+    cur.execute(f"""
+        CREATE TEMP VIEW v1_horses AS
+        SELECT horse_id, numPmu, nom, age, sexe, {identity} FROM v1.horses
+    """)
+
+    # Tables de correspondance v1 -> v2, en mémoire (temp_store = MEMORY)
+    cur.executescript("""
+    CREATE TEMP TABLE IF NOT EXISTS hippo_map (nom TEXT PRIMARY KEY, id INTEGER);
+    CREATE TEMP TABLE IF NOT EXISTS trainer_map (v1_id INTEGER PRIMARY KEY, id INTEGER);
+    CREATE TEMP TABLE IF NOT EXISTS driver_map (v1_id INTEGER PRIMARY KEY, id INTEGER);
+    CREATE TEMP TABLE IF NOT EXISTS horse_map (v1_id INTEGER PRIMARY KEY, id INTEGER);
+    CREATE TEMP TABLE IF NOT EXISTS course_map (v1_id INTEGER PRIMARY KEY, id INTEGER, existante INTEGER);
+    """)
+
+
+def chunks(cur, last_date):
+    """Journées v1 restantes (clé yyyymmdd), découpées en blocs de CHUNK_DAYS."""
+    key = SORT_KEY.format(col="date")
+    cur.execute(f"SELECT DISTINCT {key} AS d FROM v1.courses WHERE d > ? ORDER BY d",
+                (last_date or "",))
+    days = [row[0] for row in cur.fetchall()]
+    for i in range(0, len(days), CHUNK_DAYS):
+        yield days[i], days[min(i + CHUNK_DAYS, len(days)) - 1]
+
+
+# -------------------- REFERENTIELS -------------------- #
+def map_hippodromes(cur):
+    """
+    v1 ne garde que le libellé long : on le rapproche de hippodromes.libelleLong, sinon on le
+    crée sans code. get_or_create_hippodrome lui attribue son code à la première réunion
+    scrapée sur cette piste, migration et scraping partagent donc le même hippodrome_id.
+    """
+    # un seul hippodrome par libellé à la casse près, même s'il apparaît sous plusieurs
+    # casses dans le bloc (NOT EXISTS ne voit pas les lignes insérées par l'instruction)
+    cur.execute("""
+        INSERT INTO hippodromes (libelleCourt, libelleLong)
+        SELECT MIN(c.hippodrome), MIN(c.hippodrome)
+        FROM chunk c
+        WHERE c.hippodrome IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM hippodromes h WHERE upper(h.libelleLong) = upper(c.hippodrome))
+        GROUP BY upper(c.hippodrome)
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO hippo_map (nom, id)
+        SELECT c.hippodrome, MIN(h.id)
+        FROM (SELECT DISTINCT hippodrome FROM chunk) c
+        JOIN hippodromes h ON upper(h.libelleLong) = upper(c.hippodrome)
+        GROUP BY c.hippodrome
+    """)
+
+
+def map_people(cur, table, id_col, map_table):
+    """Entraîneurs / drivers : même clé (nom UNIQUE) dans les deux schémas."""
+    cur.execute(f"""
+        INSERT OR IGNORE INTO {table} (nom)
+        SELECT DISTINCT t.nom
+        FROM chunk_part p
+        JOIN v1.{table} t ON t.{id_col} = p.{id_col}
+        WHERE t.nom IS NOT NULL
+    """)
+    cur.execute(f"""
+        INSERT OR IGNORE INTO {map_table} (v1_id, id)
+        SELECT t.{id_col}, n.{id_col}
+        FROM v1.{table} t
+        JOIN {table} n ON n.nom = t.nom
+        WHERE t.{id_col} IN (
+            SELECT {id_col} FROM chunk_part
+        )
+    """)
+
+
+def map_horses(cur):
+    """
+    Anciens v1 : chevaux identifiés par numPmu (numéro de dossard), le nom stocké n'est que
+    celui du premier cheval vu avec ce numéro. Seuls les chevaux sans numPmu (nom + attributs)
+    sont fiables ; les autres participants sont migrés sans cheval (horse_id NULL).
+    Un cheval v1 est rattaché au cheval v2 de même nom et mêmes attributs, sinon créé ;
+    relinkHorses.py fusionne ensuite les fiches compatibles.
+    """
+    same_horse = """n.nom = h.nom AND n.annee_naissance IS h.annee_naissance
+        AND n.pere IS h.pere AND n.mere IS h.mere AND n.eleveur IS h.eleveur"""
+    cur.execute(f"""
+        INSERT INTO horses (nom, age, sexe, annee_naissance, pere, mere, proprietaire, eleveur)
+        SELECT h.nom, h.age, h.sexe, h.annee_naissance, h.pere, h.mere, h.proprietaire, h.eleveur
+        FROM v1_horses h
+        WHERE h.numPmu IS NULL AND h.nom IS NOT NULL
+          AND h.horse_id IN (SELECT horse_id FROM chunk_part)
+          AND NOT EXISTS (SELECT 1 FROM horses n WHERE {same_horse})
+        GROUP BY h.nom, h.annee_naissance, h.pere, h.mere, h.eleveur
+    """)
+    cur.execute(f"""
+        INSERT OR IGNORE INTO horse_map (v1_id, id)
+        SELECT h.horse_id, MIN(n.horse_id)
+        FROM v1_horses h
+        JOIN horses n ON {same_horse}
+        WHERE h.numPmu IS NULL
+          AND h.horse_id IN (SELECT horse_id FROM chunk_part)
+        GROUP BY h.horse_id
+    """)
+
+
+# -------------------- MIGRATION -------------------- #
+def migrate_courses(cur):
+    """
+    Une course déjà présente dans la BD v2 (même date, hippodrome et numéro, déjà scrapée)
+    n'est pas recréée : course_map pointe vers elle. Les autres sont insérées par INSERT…SELECT
+    dans l'ordre des ids v1 ; avec AUTOINCREMENT et un seul écrivain, les nouveaux ids sont
+    contigus : la correspondance v1 -> v2 se fait par rang.
+    """
+    # courses v2 des journées du bloc, indexées (courses n'a pas d'index sur date)
+    cur.execute("DROP TABLE IF EXISTS temp.existing")
+    cur.execute("""
+        CREATE TEMP TABLE existing AS
+        SELECT course_id, date, hippodrome_id, course_externe FROM courses
+        WHERE date IN (SELECT DISTINCT date FROM chunk)
+    """)
+    cur.execute("CREATE INDEX temp.existing_key ON existing(date, course_externe)")
+    cur.execute(f"""
+        INSERT INTO course_map (v1_id, id, existante)
+        SELECT c.course_id, MIN(x.course_id), 1
+        FROM chunk c
+        LEFT JOIN hippo_map hm ON hm.nom = c.hippodrome
+        JOIN existing x ON x.date = c.date AND x.course_externe = {COURSE_EXTERNE}
+                       AND x.hippodrome_id IS hm.id
+        GROUP BY c.course_id
+    """)
+
+    cur.execute("SELECT COALESCE(MAX(course_id), 0), COUNT(*) FROM courses")
+    max_before, _ = cur.fetchone()
+    cur.execute("SELECT COALESCE(seq, 0) FROM sqlite_sequence WHERE name = 'courses'")
+    row = cur.fetchone()
+    first_id = max(max_before, row[0] if row else 0) + 1
+
+    # reunion "R1" n'existe plus en v2
+    cur.execute(f"""
+        INSERT INTO courses
+        (date, course_externe, libelle, hippodrome_id, discipline, distance, nombre_declares)
+        SELECT c.date, {COURSE_EXTERNE}, c.libelle, hm.id, c.discipline, c.distance, c.nombre_declares
+        FROM chunk c
+        LEFT JOIN hippo_map hm ON hm.nom = c.hippodrome
+        WHERE NOT EXISTS (
+            SELECT 1 FROM existing x
+            WHERE x.date = c.date AND x.course_externe = {COURSE_EXTERNE}
+              AND x.hippodrome_id IS hm.id
+        )
+        ORDER BY c.course_id
+    """)
+    n = cur.rowcount
+
+    cur.execute("SELECT MAX(course_id) FROM courses")
+    last_id = cur.fetchone()[0] or 0
+    if n and last_id - first_id + 1 != n:
+        raise sqlite3.IntegrityError(
+            f"ids de courses non contigus ({first_id}..{last_id} pour {n} courses)")
+
+    cur.execute("""
+        INSERT INTO course_map (v1_id, id, existante)
+        SELECT course_id, ? + ROW_NUMBER() OVER (ORDER BY course_id) - 1, 0
+        FROM chunk
+        WHERE course_id NOT IN (SELECT v1_id FROM course_map)
+    """, (first_id,))
+    return n
+
+
+def migrate_participants(cur):
+    """
+    temps v1 (TEXT) -> INTEGER ; distance_reelle = distance de la course comme dans v2APIscrap.
+    Une course déjà scrapée garde ses participants (données v2 plus complètes) : ceux de v1
+    ne sont pas ajoutés une seconde fois.
+    """
+    cur.execute("""
+        INSERT INTO participants
+        (course_id, horse_id, trainer_id, driver_id, ordreArrivee, temps,
+         rapport_direct, rapport_ref, distance_reelle)
+        SELECT cm.id, hm.id, tm.id, dm.id, p.ordreArrivee,
+               CASE WHEN p.temps GLOB '[0-9]*' THEN CAST(p.temps AS INTEGER) END,
+               p.rapport_direct, p.rapport_ref, c.distance
+        FROM chunk_part p
+        JOIN chunk c ON c.course_id = p.course_id
+        JOIN course_map cm ON cm.v1_id = p.course_id AND NOT cm.existante
+        LEFT JOIN horse_map hm ON hm.v1_id = p.horse_id
+        LEFT JOIN trainer_map tm ON tm.v1_id = p.trainer_id
+        LEFT JOIN driver_map dm ON dm.v1_id = p.driver_id
+        ORDER BY p.id
+    """)
+    return cur.rowcount
+
+
+def migrate_chunk(conn, first, last):
+    cur = conn.cursor()
+    key = SORT_KEY.format(col="date")
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("DROP TABLE IF EXISTS temp.chunk")
+        cur.execute(f"""
+            CREATE TEMP TABLE chunk AS
+            SELECT * FROM v1.courses WHERE {key} BETWEEN ? AND ?
+        """, (first, last))
+        cur.execute("CREATE UNIQUE INDEX temp.chunk_id ON chunk(course_id)")
+        cur.execute("DROP TABLE IF EXISTS temp.chunk_part")
+        cur.execute("""
+            CREATE TEMP TABLE chunk_part AS
+            SELECT p.* FROM chunk c JOIN v1.participants p ON p.course_id = c.course_id
+        """)
+        # les correspondances de courses ne servent qu'au bloc courant
+        cur.execute("DELETE FROM course_map")
+
+        map_hippodromes(cur)
+        map_people(cur, "trainers", "trainer_id", "trainer_map")
+        map_people(cur, "drivers", "driver_id", "driver_map")
+        map_horses(cur)
+        n_courses = migrate_courses(cur)
+        n_part = migrate_participants(cur)
+
+        # progression dans la même transaction : une reprise ne migre jamais deux fois
+        cur.execute("UPDATE migration_v1 SET last_date = ? WHERE id = 1", (last,))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return n_courses, n_part
+
+
+def main():
+    v1_file = sys.argv[1] if len(sys.argv) > 1 else V1_DB
+    v2_file = sys.argv[2] if len(sys.argv) > 2 else V2_DB
+    if not os.path.exists(v1_file):
+        print(f"[ERROR] {v1_file} introuvable")
+        return
+
+    conn = sqlite3.connect(v2_file, isolation_level=None)
+    setup(conn, v1_file)
+    cur = conn.cursor()
+
+    cur.execute("SELECT last_date FROM migration_v1 WHERE id = 1")
+    last_date = cur.fetchone()[0]
+    if last_date:
+        print(f"Reprise après le {last_date[6:8]}/{last_date[4:6]}/{last_date[0:4]}")
+    else:
+        print(f"Migration de {v1_file} vers {v2_file}")
+
+    t0 = time.time()
+    total_courses = total_part = 0
+    for first, last in list(chunks(cur, last_date)):
+        n_courses, n_part = migrate_chunk(conn, first, last)
+        total_courses += n_courses
+        total_part += n_part
+        print(f"   > {first} -> {last} : {n_courses} courses, {n_part} participants")
+
+    cur.execute("SELECT COUNT(*) FROM participants WHERE horse_id IS NULL")
+    print(f"{cur.fetchone()[0]} participants sans cheval identifié (numPmu v1)")
+    conn.close()
+    print(f"Migration terminée ✅ {total_courses} courses, {total_part} participants "
+          f"en {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
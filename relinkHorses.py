@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import sys
+import time
+
+from dedupeDB import course_key, keyed_courses
+from schemaV2 import SCHEMA, upgrade_horses
+
+DB_FILE = "pmu.sqlite"
+
+# La date est stockée en ddmmyyyy : clé triable yyyymmdd
+JOUR = "(substr(c.date, 5, 4) || substr(c.date, 3, 2) || substr(c.date, 1, 2))"
+
+
+# -------------------- SEPARATION DES HOMONYMES -------------------- #
+def count_duplicate_races(cur):
+    """Courses en double (même clé naturelle que dedupeDB) : elles feraient croire à deux courses le même jour."""
+    source, partition = keyed_courses(course_key(cur))
+    cur.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM {source} GROUP BY {", ".join(partition)} HAVING COUNT(*) > 1
+        )
+    """)
+    return cur.fetchone()[0]
+
+
+def find_suspects(cur):
+    """
+    Chevaux dont l'historique est impossible pour un seul cheval : deux courses distinctes
+    le même jour, ou un nombre de courses courues (nombreCourses PMU) qui diminue.
+    """
+    cur.execute("DROP TABLE IF EXISTS temp.suspects")
+    cur.execute(f"""
+        CREATE TEMP TABLE suspects AS
+        SELECT p.horse_id
+        FROM participants p
+        JOIN courses c ON c.course_id = p.course_id
+        WHERE p.horse_id IS NOT NULL
+        GROUP BY p.horse_id, c.date
+        HAVING COUNT(DISTINCT c.hippodrome_id || '/' || c.course_externe) > 1
+        UNION
+        SELECT horse_id FROM (
+            SELECT p.horse_id,
+                   LAG(p.courses_courues) OVER (PARTITION BY p.horse_id ORDER BY {JOUR}, p.id) AS precedent,
+                   p.courses_courues
+            FROM participants p
+            JOIN courses c ON c.course_id = p.course_id
+            WHERE p.horse_id IS NOT NULL
+        )
+        WHERE precedent > courses_courues
+    """)
+    cur.execute("SELECT COUNT(*) FROM suspects")
+    return cur.fetchone()[0]
+
+
+def split_chains(rows):
+    """
+    Répartit les courses d'un nom en carrières : chaque course va à la carrière dont le
+    dernier nombre de courses courues est le plus proche (sans le dépasser, comme dans
+    find_suspects : un non-partant ne fait pas avancer le compteur), sinon une nouvelle
+    carrière est ouverte. rows = [(participant_id, jour, courses_courues)] triés par date.
+    """
+    chains = []  # [dernier jour, dernier compteur, [participant_id]]
+    for pid, jour, n in rows:
+        best = None
+        for chain in chains:
+            last_jour, last_n, _ = chain
+            if last_jour >= jour:
+                continue
+            if n is not None and last_n is not None and last_n > n:
+                continue
+            key = (-1 if last_n is None else last_n, last_jour)
+            if best is None or key > (-1 if best[1] is None else best[1], best[0]):
+                best = chain
+        if best is None:
+            chains.append([jour, n, [pid]])
+        else:
+            best[0] = jour
+            best[1] = n if n is not None else best[1]
+            best[2].append(pid)
+    return [chain[2] for chain in chains]
+
+
+def split_suspects(cur):
+    """
+    La carrière contenant la première participation enregistrée garde le horse_id d'origine
+    (c'est elle qui a fourni horses.age), les autres deviennent de nouveaux chevaux.
+    """
+    cur.execute(f"""
+        SELECT p.horse_id, p.id, {JOUR}, p.courses_courues
+        FROM participants p
+        JOIN courses c ON c.course_id = p.course_id
+        WHERE p.horse_id IN (SELECT horse_id FROM suspects)
+        ORDER BY p.horse_id, {JOUR}, p.id
+    """)
+    by_horse = {}
+    for horse_id, pid, jour, n in cur.fetchall():
+        by_horse.setdefault(horse_id, []).append((pid, jour, n))
+
+    relinks = []
+    created = 0
+    for horse_id, rows in by_horse.items():
+        chains = split_chains(rows)
+        chains.sort(key=min)
+        for chain in chains[1:]:
+            # âge, sexe, année de naissance... ne sont connus que pour la carrière d'origine :
+            # NULL, compatible avec tout dans match_horse, le scraper les complètera
+            cur.execute("""
+                INSERT INTO horses (nom)
+                SELECT nom FROM horses WHERE horse_id = ?
+            """, (horse_id,))
+            created += 1
+            relinks.extend((cur.lastrowid, pid) for pid in chain)
+
+    cur.executemany("UPDATE participants SET horse_id = ? WHERE id = ?", relinks)
+    return created, len(relinks)
+
+
+# -------------------- FUSION -------------------- #
+def backfill_birth_year(cur):
+    """horses.age est l'âge à la première course enregistrée : année de naissance = année - âge."""
+    cur.execute("""
+        UPDATE horses
+        SET annee_naissance = CAST(substr(c.date, 5, 4) AS INTEGER) - horses.age
+        FROM (SELECT horse_id, MIN(id) AS first_id FROM participants GROUP BY horse_id) f
+        JOIN participants p ON p.id = f.first_id
+        JOIN courses c ON c.course_id = p.course_id
+        WHERE f.horse_id = horses.horse_id
+          AND horses.annee_naissance IS NULL
+          AND horses.age IS NOT NULL
+    """)
+    return cur.rowcount
+
+
+def merge_duplicates(cur):
+    """
+    Fusionne les fiches d'un même cheval (v1 migré, anciennes fiches sans généalogie) avec la
+    règle de match_horse : même nom, même année de naissance, aucun attribut connu des deux
+    côtés qui diffère (NULL compatible), pas de femelle / non femelle.
+    Les fiches les plus renseignées servent de référence ; une fiche n'est fusionnée que si
+    elle est compatible avec une seule référence (sinon l'homonymie est ambiguë).
+    """
+    cur.execute("DROP TABLE IF EXISTS temp.h")
+    cur.execute("""
+        CREATE TEMP TABLE h AS
+        SELECT horse_id, upper(trim(nom)) AS k, annee_naissance, pere, mere, eleveur,
+               CASE WHEN sexe IS NULL THEN NULL WHEN sexe LIKE 'FEMELLE%' THEN 1 ELSE 0 END AS fem,
+               ROW_NUMBER() OVER (
+                   PARTITION BY upper(trim(nom)), annee_naissance
+                   ORDER BY (pere IS NOT NULL) + (mere IS NOT NULL) + (eleveur IS NOT NULL) DESC, horse_id
+               ) AS rang
+        FROM horses
+        WHERE annee_naissance IS NOT NULL AND nom IS NOT NULL
+    """)
+    cur.execute("CREATE INDEX temp.h_key ON h(k, annee_naissance)")
+    # paires (fiche, fiche plus renseignée compatible)
+    cur.execute("DROP TABLE IF EXISTS temp.compatibles")
+    cur.execute("""
+        CREATE TEMP TABLE compatibles AS
+        SELECT a.horse_id AS old_id, b.horse_id AS keep_id
+        FROM h a
+        JOIN h b ON b.k = a.k AND b.annee_naissance = a.annee_naissance AND b.rang < a.rang
+        WHERE (a.pere IS NULL OR b.pere IS NULL OR a.pere = b.pere)
+          AND (a.mere IS NULL OR b.mere IS NULL OR a.mere = b.mere)
+          AND (a.eleveur IS NULL OR b.eleveur IS NULL OR a.eleveur = b.eleveur)
+          AND (a.fem IS NULL OR b.fem IS NULL OR a.fem = b.fem)
+    """)
+    # références = fiches sans fiche plus renseignée compatible ; elles ne bougent jamais
+    cur.execute("DROP TABLE IF EXISTS temp.horse_map")
+    cur.execute("""
+        CREATE TEMP TABLE horse_map AS
+        SELECT old_id, MIN(keep_id) AS keep_id
+        FROM compatibles
+        WHERE keep_id NOT IN (SELECT old_id FROM compatibles)
+        GROUP BY old_id
+        HAVING COUNT(*) = 1
+    """)
+    cur.execute("CREATE UNIQUE INDEX temp.horse_map_old ON horse_map(old_id)")
+
+    # la référence récupère les attributs qui lui manquent, s'ils ne se contredisent pas
+    for col in ("pere", "mere", "eleveur", "proprietaire", "sexe"):
+        cur.execute(f"""
+            UPDATE horses
+            SET {col} = (
+                SELECT CASE WHEN MIN(x.{col}) = MAX(x.{col}) THEN MIN(x.{col}) END
+                FROM horse_map m JOIN horses x ON x.horse_id = m.old_id
+                WHERE m.keep_id = horses.horse_id
+            )
+            WHERE {col} IS NULL AND horse_id IN (SELECT keep_id FROM horse_map)
+        """)
+
+    cur.execute("""
+        UPDATE participants
+        SET horse_id = (SELECT keep_id FROM horse_map WHERE old_id = participants.horse_id)
+        WHERE horse_id IN (SELECT old_id FROM horse_map)
+    """)
+    relinked = cur.rowcount
+    cur.execute("DELETE FROM horses WHERE horse_id IN (SELECT old_id FROM horse_map)")
+    return cur.rowcount, relinked
+
+
+# -------------------- MAIN -------------------- #
+def main():
+    db_file = sys.argv[1] if len(sys.argv) > 1 else DB_FILE
+    if not os.path.exists(db_file):
+        print(f"[ERROR] {db_file} introuvable")
+        return
+
+    t0 = time.time()
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    cur = conn.cursor()
+    print(f"=== Ré-identification des chevaux de {db_file} ===")
+
+    # vérifié avant toute modification du schéma : un refus laisse la BD intacte
+    if not course_key(cur):
+        print(f"[ERROR] {db_file} : pas de table courses")
+        conn.close()
+        return
+    n_dup = count_duplicate_races(cur)
+    if n_dup:
+        print(f"[ERROR] {n_dup} courses en double : lancer d'abord python dedupeDB.py {db_file}")
+        conn.close()
+        return
+
+    cur.executescript(SCHEMA)
+    upgrade_horses(conn)
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        print(f"  -> {find_suspects(cur)} chevaux avec un historique incohérent (homonymes fusionnés)")
+        created, relinked = split_suspects(cur)
+        print(f"  -> {created} chevaux créés, {relinked} participations rattachées")
+        print(f"  -> {backfill_birth_year(cur)} années de naissance complétées")
+        deleted, relinked = merge_duplicates(cur)
+        print(f"  -> {deleted} chevaux en double fusionnés, {relinked} participations rattachées")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+    conn.close()
+    print(f"Terminé en {time.time() - t0:.1f}s ✅")
+
+
+if __name__ == "__main__":
+    main()
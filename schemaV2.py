@@ -0,0 +1,131 @@
+# Schéma de la BD v2 (pmu.sqlite), partagé par v2APIscrap, migrateV1toV2 et relinkHorses.
+# N'ouvre aucune connexion : les outils de maintenance n'ont pas à importer le scraper.
+
+# -------------------- CREATE TABLES -------------------- #
+# nom non unique : les homonymes sont distingués par annee_naissance / pere / mere / eleveur
+HORSES_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    horse_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nom TEXT,
+    age INTEGER,
+    sexe TEXT,
+    annee_naissance INTEGER,
+    pere TEXT,
+    mere TEXT,
+    proprietaire TEXT,
+    eleveur TEXT
+);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hippodromes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT UNIQUE,
+    libelleCourt TEXT,
+    libelleLong TEXT
+);
+
+CREATE TABLE IF NOT EXISTS courses (
+    course_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT,
+    categorie TEXT,
+    course_externe TEXT,
+    libelle TEXT,
+    hippodrome_id INTEGER,
+    terrain_id INTEGER,
+    discipline TEXT,
+    specialite TEXT,
+    distance INTEGER,
+    heure_depart INTEGER,
+    duree INTEGER,
+    nombre_declares INTEGER,
+    FOREIGN KEY(hippodrome_id) REFERENCES hippodromes(id)
+    FOREIGN KEY(terrain_id) REFERENCES terrain(id)
+);
+
+{horses}
+
+CREATE TABLE IF NOT EXISTS trainers (
+    trainer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nom TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS drivers (
+    driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nom TEXT UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS terrain (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT,
+    etat TEXT
+);
+
+CREATE TABLE IF NOT EXISTS participants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_id INTEGER,
+    horse_id INTEGER,
+    trainer_id INTEGER,
+    driver_id INTEGER,
+    ordreArrivee INTEGER,
+    temps INTEGER,
+    rapport_direct REAL,
+    rapport_ref REAL,
+    courses_courues INTEGER,
+    courses_gagnees INTEGER,
+    courses_placees INTEGER,
+    distance_reelle INTEGER,
+    disqualifie BOOLEAN,
+    FOREIGN KEY(course_id) REFERENCES courses(course_id),
+    FOREIGN KEY(horse_id) REFERENCES horses(horse_id),
+    FOREIGN KEY(trainer_id) REFERENCES trainers(trainer_id),
+    FOREIGN KEY(driver_id) REFERENCES drivers(driver_id)
+);
+""".replace("{horses}", HORSES_TABLE.format(table="horses").strip())
+
+# Créé après upgrade_horses() : la reconstruction de la table supprime ses index
+HORSES_INDEX = "CREATE INDEX IF NOT EXISTS idx_horses_nom ON horses(nom)"
+
+# -------------------- MISES A JOUR -------------------- #
+def horses_columns(cur, table="horses"):
+    """(nom, type déclaré) des colonnes de la table."""
+    cur.execute(f"PRAGMA table_info({table})")
+    return [(info[1], info[2]) for info in cur.fetchall()]
+
+def upgrade_horses(conn):
+    """
+    Anciennes BD : horses.nom était UNIQUE (homonymes fusionnés). SQLite ne sait pas
+    supprimer une contrainte, on reconstruit donc la table en gardant les horse_id
+    (copie puis renommage de la nouvelle table, pour ne pas toucher aux clés étrangères).
+    Toutes les colonnes existantes sont copiées, y compris celles que le schéma actuel
+    n'a plus (numPmu des anciennes BD), ajoutées à la nouvelle table.
+    """
+    cur = conn.cursor()
+    if "annee_naissance" not in dict(horses_columns(cur)):
+        # une seule transaction explicite : même en autocommit (isolation_level=None),
+        # un arrêt entre DROP et RENAME ne peut pas laisser horses vide
+        if conn.in_transaction:
+            conn.commit()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            # un autre process (worker) a pu reconstruire la table pendant qu'on attendait le verrou
+            existing = horses_columns(cur)
+            if "annee_naissance" not in dict(existing):
+                print("Mise à jour de la table horses (identité des chevaux)...")
+                cur.execute("DROP TABLE IF EXISTS horses_new")
+                cur.execute(HORSES_TABLE.format(table="horses_new"))
+                new_columns = dict(horses_columns(cur, "horses_new"))
+                for col, col_type in existing:
+                    if col not in new_columns:
+                        cur.execute(f"ALTER TABLE horses_new ADD COLUMN {col} {col_type}")
+                copied = ", ".join(col for col, _ in existing)
+                cur.execute(f"INSERT INTO horses_new ({copied}) SELECT {copied} FROM horses")
+                cur.execute("DROP TABLE horses")
+                cur.execute("ALTER TABLE horses_new RENAME TO horses")
+            cur.execute(HORSES_INDEX)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    cur.execute(HORSES_INDEX)
+    conn.commit()
@@ -0,0 +1,372 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# === CONFIG ===
+DB_FILE = "pmu.sqlite"
+CACHE_DIR = "cache_walkforward"
+MIN_TRAIN_DATES = 180       # nombre minimum de journées dans le premier train
+FOLD_DATES = 60             # nombre de journées par bloc de test (walk-forward)
+N_WORKERS = os.cpu_count() or 1
+STATS_BLOCK = 1_000_000     # lignes de X lues à la fois pour les stats de normalisation
+
+# Grille d'hyperparamètres (régression logistique "gagnant / pas gagnant")
+GRID = {
+    "lr": [0.05, 0.1, 0.3],
+    "l2": [0.0, 1e-3, 1e-2],
+    "epochs": [200, 500],
+}
+
+FEATURES = [
+    "rapport_ref",
+    "rapport_direct",
+    "courses_courues",
+    "courses_gagnees",
+    "courses_placees",
+    "taux_victoire",
+    "taux_place",
+    "handicap",
+    "distance",
+    "nombre_declares",
+]
+
+# La date est stockée en ddmmyyyy : on la convertit en yyyymmdd pour pouvoir trier
+SQL_DATASET = """
+SELECT
+    CAST(substr(c.date, 5, 4) || substr(c.date, 3, 2) || substr(c.date, 1, 2) AS INTEGER) AS jour,
+    p.course_id,
+    p.rapport_ref,
+    p.rapport_direct,
+    p.courses_courues,
+    p.courses_gagnees,
+    p.courses_placees,
+    p.distance_reelle,
+    c.distance,
+    c.nombre_declares,
+    p.ordreArrivee
+FROM participants p
+JOIN courses c ON c.course_id = p.course_id
+ORDER BY jour, p.course_id, p.id
+"""
+
+
+# -------------------- DONNEES -------------------- #
+def data_version(conn):
+    """Empreinte de la BD : change dès qu'une course ou un participant est ajouté/supprimé."""
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), MAX(course_id), MAX(date) FROM courses")
+    courses = cur.fetchone()
+    cur.execute("SELECT COUNT(*), MAX(id) FROM participants")
+    participants = cur.fetchone()
+    raw = json.dumps([courses, participants, FEATURES])
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def build_dataset(conn, out_dir):
+    """
+    Construit une seule fois les tableaux X / y / jour / course triés par date
+    et les écrit en .npy dans out_dir (relus ensuite en memmap par les workers).
+    """
+    rows = conn.execute(SQL_DATASET).fetchall()
+    n = len(rows)
+    print(f"Construction du dataset : {n} participants")
+
+    raw = np.array(rows, dtype=np.float64) if n else np.empty((0, 11))
+    jour = raw[:, 0].astype(np.int64)
+    course = raw[:, 1].astype(np.int64)
+    rap_ref, rap_direct = raw[:, 2], raw[:, 3]
+    courues, gagnees, placees = raw[:, 4], raw[:, 5], raw[:, 6]
+    dist_reelle, distance, declares = raw[:, 7], raw[:, 8], raw[:, 9]
+    ordre = raw[:, 10]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taux_victoire = np.where(courues > 0, gagnees / courues, 0.0)
+        taux_place = np.where(courues > 0, placees / courues, 0.0)
+
+    X = np.column_stack([
+        rap_ref,
+        rap_direct,
+        courues,
+        gagnees,
+        placees,
+        taux_victoire,
+        taux_place,
+        dist_reelle - distance,
+        distance,
+        declares,
+    ]).astype(np.float32)
+    y = (ordre == 1).astype(np.float32)
+
+    os.makedirs(out_dir, exist_ok=True)
+    # écriture dans un fichier temporaire puis renommage : un dataset à moitié écrit
+    # ne doit jamais être relu comme valide
+    for name, arr in (("X", X), ("y", y), ("jour", jour), ("course", course)):
+        tmp = os.path.join(out_dir, f"{name}.tmp.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, os.path.join(out_dir, f"{name}.npy"))
+    return n
+
+
+def make_folds(jour, min_train_dates, fold_dates):
+    """
+    Découpage walk-forward sur les journées : le train contient toutes les journées
+    avant le bloc de test. Les données étant triées, un fold n'est qu'une paire
+    de bornes d'indices (pas de copie).
+    Les blocs sont de taille fixe à partir du début de l'historique : ajouter des
+    journées ne modifie que le dernier bloc (les autres restent en cache).
+    """
+    dates = np.unique(jour)
+    folds = []
+    for i in range(min_train_dates, len(dates), fold_dates):
+        bloc = dates[i:i + fold_dates]
+        start = int(np.searchsorted(jour, bloc[0], side="left"))
+        end = int(np.searchsorted(jour, bloc[-1], side="right"))
+        folds.append({"train_end": start, "test_start": start, "test_end": end,
+                      "test_from": int(bloc[0]), "test_to": int(bloc[-1])})
+    return folds
+
+
+# -------------------- MODELE -------------------- #
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def fold_stats(folds, data_dir):
+    """
+    Moyenne / écart-type du train de chaque fold, calculés une seule fois dans le process
+    principal : les trains sont emboîtés, un seul passage sur X (par blocs de STATS_BLOCK).
+    Les NaN valent la moyenne du train : ils ne comptent pas dans l'écart à la moyenne.
+    Les sommes sont décalées par une première estimation de la moyenne (précision float64).
+    """
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # colonne entièrement NaN
+        decalage = np.nanmean(np.asarray(X[:STATS_BLOCK], dtype=np.float64), axis=0)
+    decalage = np.where(np.isnan(decalage), 0.0, decalage)
+
+    somme = np.zeros(X.shape[1])
+    carres = np.zeros(X.shape[1])
+    presents = np.zeros(X.shape[1])
+    done = 0
+    stats = []
+    for fold in folds:
+        for start in range(done, fold["train_end"], STATS_BLOCK):
+            bloc = np.asarray(X[start:min(start + STATS_BLOCK, fold["train_end"])], dtype=np.float64)
+            ok = ~np.isnan(bloc)
+            bloc = np.where(ok, bloc - decalage, 0.0)
+            somme += bloc.sum(axis=0)
+            carres += (bloc * bloc).sum(axis=0)
+            presents += ok.sum(axis=0)
+        done = max(done, fold["train_end"])
+
+        moy = np.divide(somme, presents, out=np.zeros_like(somme), where=presents > 0)
+        var = np.maximum(carres - presents * moy * moy, 0.0) / max(fold["train_end"], 1)
+        std = np.sqrt(var)
+        std[std == 0] = 1.0
+        stats.append(((moy + decalage).astype(np.float32), std.astype(np.float32)))
+    return stats
+
+
+def standardize(X, mean, std):
+    """Centre/réduit X sur place (NaN -> moyenne du train) : aucune copie supplémentaire."""
+    np.copyto(X, mean, where=np.isnan(X))
+    X -= mean
+    X /= std
+    return X
+
+
+def train_logreg(X, y, lr, l2, epochs):
+    # poids dans le type de X (float32) : X @ w ne convertit pas X en float64
+    w = np.zeros(X.shape[1], dtype=X.dtype)
+    b = 0.0
+    n = max(len(y), 1)
+    for _ in range(epochs):
+        p = sigmoid(X @ w + b)
+        err = p - y
+        w -= lr * (X.T @ err / n + l2 * w)
+        b -= lr * err.mean()
+    return w, b
+
+
+def evaluate(p, y, course):
+    """Log loss + taux de gagnants trouvés (le favori du modèle dans chaque course)."""
+    eps = 1e-7
+    p = np.clip(np.asarray(p, dtype=np.float64), eps, 1 - eps)
+    logloss = float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+    # course est trié par course dans chaque journée : on repère les débuts de groupes
+    debut = np.flatnonzero(np.r_[True, course[1:] != course[:-1]])
+    idx_groupe = np.repeat(np.arange(len(debut)), np.diff(np.r_[debut, len(p)]))
+    # un seul favori par course (le premier en cas d'égalité) : tri par course, proba décroissante, rang
+    ordre = np.lexsort((np.arange(len(p)), -p, idx_groupe))
+    gagnes = y[ordre[debut]] == 1
+    return {"logloss": logloss, "hit_rate": float(gagnes.mean()), "n_courses": int(len(debut))}
+
+
+# -------------------- WORKERS -------------------- #
+_shared = {}
+
+
+def init_worker(data_dir):
+    """Chaque process ouvre les tableaux une seule fois, en memmap (lecture seule, zéro copie)."""
+    for name in ("X", "y", "course"):
+        _shared[name] = np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode="r")
+
+
+def run_task(fold, config, mean, std):
+    """Une seule copie float32 du train (normalisée sur place), y et le test restent en memmap."""
+    X, y, course = _shared["X"], _shared["y"], _shared["course"]
+    test = slice(fold["test_start"], fold["test_end"])
+
+    t0 = time.time()
+    X_train = standardize(np.array(X[:fold["train_end"]]), mean, std)
+    w, b = train_logreg(X_train, y[:fold["train_end"]], config["lr"], config["l2"], config["epochs"])
+    del X_train
+    X_test = standardize(np.array(X[test]), mean, std)
+    result = evaluate(sigmoid(X_test @ w + b), y[test], np.asarray(course[test]))
+    result["duree"] = round(time.time() - t0, 3)
+    return result
+
+
+# -------------------- CACHE -------------------- #
+def fold_keys(folds, data_dir):
+    """
+    Empreinte des lignes vues par chaque fold (train + test) : clé de cache indépendante
+    du reste de la BD. Les folds sont emboîtés, on hache donc le dataset une seule fois.
+    """
+    arrays = [np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode="r")
+              for name in ("X", "y", "course")]
+    h = hashlib.sha256()
+    done = 0
+    keys = []
+    for fold in folds:
+        for arr in arrays:
+            h.update(np.ascontiguousarray(arr[done:fold["test_end"]]).tobytes())
+        done = fold["test_end"]
+        k = h.copy()
+        k.update(json.dumps(fold, sort_keys=True).encode())
+        keys.append(k.hexdigest()[:16])
+    return keys
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def result_path(fold_key, config):
+    return os.path.join(CACHE_DIR, "results", f"{fold_key}_{config_hash(config)}.json")
+
+
+def load_result(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_result(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+
+
+# -------------------- MAIN -------------------- #
+def iter_configs(grid):
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def main():
+    conn = sqlite3.connect(DB_FILE)
+    version = data_version(conn)
+    data_dir = os.path.join(CACHE_DIR, "data", version)
+
+    if os.path.exists(os.path.join(data_dir, "course.npy")):
+        print(f"Dataset {version} déjà construit, réutilisation")
+    else:
+        build_dataset(conn, data_dir)
+        # les anciennes versions du dataset ne servent plus (les résultats sont gardés à part)
+        data_root = os.path.dirname(data_dir)
+        for old in os.listdir(data_root):
+            if old != version:
+                shutil.rmtree(os.path.join(data_root, old), ignore_errors=True)
+    conn.close()
+
+    jour = np.load(os.path.join(data_dir, "jour.npy"), mmap_mode="r")
+    folds = make_folds(np.asarray(jour), MIN_TRAIN_DATES, FOLD_DATES)
+    if not folds:
+        print("[NO DATA] pas assez de journées pour un découpage walk-forward")
+        return
+    configs = list(iter_configs(GRID))
+
+    results = {}
+    todo = []
+    keys = fold_keys(folds, data_dir)
+    for fi, fold in enumerate(folds):
+        fold_key = keys[fi]
+        for config in configs:
+            path = result_path(fold_key, config)
+            cached = load_result(path)
+            if cached is not None:
+                results[(fi, config_hash(config))] = cached
+            else:
+                todo.append((fi, fold, config, path))
+
+    print(f"{len(folds)} folds x {len(configs)} configs : "
+          f"{len(results)} en cache, {len(todo)} à calculer")
+
+    if todo:
+        # normalisation commune à toutes les configs d'un fold : calculée une fois ici
+        stats = fold_stats(folds, data_dir)
+        with ProcessPoolExecutor(max_workers=N_WORKERS, initializer=init_worker,
+                                 initargs=(data_dir,)) as pool:
+            futures = {pool.submit(run_task, fold, config, *stats[fi]): (fi, fold, config, path)
+                       for fi, fold, config, path in todo}
+            for fut in as_completed(futures):
+                fi, fold, config, path = futures[fut]
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    print(f"[ERROR] fold {fi} {config} -> {e}")
+                    continue
+                save_result(path, res)
+                results[(fi, config_hash(config))] = res
+                print(f"   > fold {fi} ({fold['test_from']} -> {fold['test_to']}) {config} : "
+                      f"logloss={res['logloss']:.4f} hit={res['hit_rate']:.3f}")
+
+    # Moyenne sur les folds pour chaque config
+    summary = []
+    for config in configs:
+        h = config_hash(config)
+        per_fold = [results[(fi, h)] for fi in range(len(folds)) if (fi, h) in results]
+        if not per_fold:
+            continue
+        summary.append((
+            float(np.mean([r["logloss"] for r in per_fold])),
+            float(np.mean([r["hit_rate"] for r in per_fold])),
+            len(per_fold),
+            config,
+        ))
+    summary.sort(key=lambda s: s[0])
+
+    print("\n=== Résultats (moyenne walk-forward) ===")
+    for logloss, hit, n, config in summary:
+        print(f"{config} : logloss={logloss:.4f} hit={hit:.3f} ({n}/{len(folds)} folds)")
+    if summary:
+        print(f"\nMeilleure config : {summary[0][3]}")
+
+
+if __name__ == "__main__":
+    main()
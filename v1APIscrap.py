@@ -1,8 +1,12 @@
+import argparse
+import os
 import requests
 import sqlite3
 import time
 from datetime import datetime, timedelta
 
+from horseIdentity import HORSE_COLUMNS, load_horse_index, resolve_horse
+
 # === CONFIG ===
 BASE = "https://offline.turfinfo.api.pmu.fr/rest/client/1"
 DB_NAME = "pmu_full.db"
@@ -11,11 +15,8 @@ END_DATE = datetime.today() - timedelta(days=1)
 SLEEP_BASE = 0.1  # secondes entre requêtes
 
 # === SQLite setup ===
-conn = sqlite3.connect(DB_NAME)
-cur = conn.cursor()
-
-# Table courses
-cur.execute("""
+SCHEMA = """
+-- Table courses
 CREATE TABLE IF NOT EXISTS courses (
     course_id INTEGER PRIMARY KEY AUTOINCREMENT,
     date TEXT,
@@ -26,38 +27,35 @@ CREATE TABLE IF NOT EXISTS courses (
     discipline TEXT,
     distance INTEGER,
     nombre_declares INTEGER
-)
-""")
+);
 
-# Table horses
-cur.execute("""
+-- Table horses (numPmu n'est plus renseigné : c'est le numéro de dossard, pas une identité)
 CREATE TABLE IF NOT EXISTS horses (
     horse_id INTEGER PRIMARY KEY AUTOINCREMENT,
     numPmu INTEGER UNIQUE,
     nom TEXT,
     age INTEGER,
-    sexe TEXT
-)
-""")
-
-# Table trainers
-cur.execute("""
+    sexe TEXT,
+    annee_naissance INTEGER,
+    pere TEXT,
+    mere TEXT,
+    proprietaire TEXT,
+    eleveur TEXT
+);
+
+-- Table trainers
 CREATE TABLE IF NOT EXISTS trainers (
     trainer_id INTEGER PRIMARY KEY AUTOINCREMENT,
     nom TEXT UNIQUE
-)
-""")
+);
 
-# Table drivers
-cur.execute("""
+-- Table drivers
 CREATE TABLE IF NOT EXISTS drivers (
     driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
     nom TEXT UNIQUE
-)
-""")
+);
 
-# Table participants (liaison course <-> cheval)
-cur.execute("""
+-- Table participants (liaison course <-> cheval)
 CREATE TABLE IF NOT EXISTS participants (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     course_id INTEGER,
@@ -72,19 +70,60 @@ CREATE TABLE IF NOT EXISTS participants (
     FOREIGN KEY(horse_id) REFERENCES horses(horse_id),
     FOREIGN KEY(trainer_id) REFERENCES trainers(trainer_id),
     FOREIGN KEY(driver_id) REFERENCES drivers(driver_id)
-)
-""")
+);
 
-# Table pour reprendre
-cur.execute("""
+-- Table pour reprendre
 CREATE TABLE IF NOT EXISTS progress (
     id INTEGER PRIMARY KEY CHECK (id = 1),
     last_date TEXT
-)
-""")
-
-cur.execute("INSERT OR IGNORE INTO progress (id, last_date) VALUES (1, NULL)")
-conn.commit()
+);
+
+INSERT OR IGNORE INTO progress (id, last_date) VALUES (1, NULL);
+"""
+
+# Connexion ouverte au premier accès (et non à l'import) : une connexion par process
+_conn = None
+_conn_pid = None
+_horses = None  # index des chevaux en mémoire (identifiés par nom + attributs, hors numPmu)
+
+def configure(db_name=None, base=None):
+    """Change la BD et/ou l'URL de l'API avant utilisation (ferme la connexion courante)."""
+    global DB_NAME, BASE
+    if db_name is not None and db_name != DB_NAME:
+        close()
+        DB_NAME = db_name
+    if base is not None:
+        BASE = base
+
+def get_conn():
+    global _conn, _conn_pid, _horses
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = sqlite3.connect(DB_NAME)
+        _conn.executescript(SCHEMA)
+        add_horse_identity_columns(_conn)
+        _conn.commit()
+        _conn_pid = os.getpid()
+        _horses = None
+    return _conn
+
+def close():
+    global _conn, _conn_pid, _horses
+    if _conn is not None and _conn_pid == os.getpid():
+        _conn.close()
+    _conn = None
+    _conn_pid = None
+    _horses = None
+
+def add_horse_identity_columns(conn):
+    """Anciennes BD v1 : ajoute les colonnes d'identité des chevaux si elles manquent."""
+    cur = conn.cursor()
+    cur.execute("PRAGMA table_info(horses)")
+    existing_columns = [info[1] for info in cur.fetchall()]
+    for col in HORSE_COLUMNS:
+        if col not in existing_columns:
+            col_type = "INTEGER" if col == "annee_naissance" else "TEXT"
+            cur.execute(f"ALTER TABLE horses ADD COLUMN {col} {col_type}")
+    conn.commit()
 
 # === Fonctions utilitaires ===
 
@@ -112,6 +151,8 @@ def safe_name(field):
 def get_or_create_trainer(name):
     if not name:
         return None
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT trainer_id FROM trainers WHERE nom = ?", (name,))
     row = cur.fetchone()
     if row:
@@ -123,6 +164,8 @@ def get_or_create_trainer(name):
 def get_or_create_driver(name):
     if not name:
         return None
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT driver_id FROM drivers WHERE nom = ?", (name,))
     row = cur.fetchone()
     if row:
@@ -131,21 +174,19 @@ def get_or_create_driver(name):
     conn.commit()
     return cur.lastrowid
 
-def get_or_create_horse(numPmu, nom, age, sexe):
-    if numPmu is None:
-        # S'il n'y a pas de numPmu, on peut tenter par nom, mais attention aux doublons
-        cur.execute("SELECT horse_id FROM horses WHERE nom = ? AND numPmu IS NULL", (nom,))
-    else:
-        cur.execute("SELECT horse_id FROM horses WHERE numPmu = ?", (numPmu,))
-    row = cur.fetchone()
-    if row:
-        return row[0]
-    cur.execute("""
-        INSERT INTO horses (numPmu, nom, age, sexe) 
-        VALUES (?, ?, ?, ?)
-    """, (numPmu, nom, age, sexe))
-    conn.commit()
-    return cur.lastrowid
+def get_or_create_horse(nom, age, sexe, date_str=None, pere=None, mere=None,
+                        proprietaire=None, eleveur=None):
+    """
+    Même résolution que v2APIscrap (nom + année de naissance / généalogie). Les anciens
+    chevaux indexés sur numPmu (numéro de dossard) sont ignorés : leur nom n'est pas fiable.
+    """
+    global _horses
+    if not nom:
+        return None
+    conn = get_conn()
+    if _horses is None:
+        _horses = load_horse_index(conn, "WHERE numPmu IS NULL")
+    return resolve_horse(conn, _horses, nom, age, sexe, date_str, pere, mere, proprietaire, eleveur)
 
 def process_date(date_str):
     print(f"\n=== Traitement du {date_str} ===")
@@ -161,6 +202,9 @@ def process_date(date_str):
         print(f"[NO REUNION] {date_str} : aucune réunion trouvée")
         return
 
+    conn = get_conn()
+    cur = conn.cursor()
+
     for reunion in reunions:
         r_code = f"R{reunion['numOfficiel']}"
         hippodrome = reunion.get("hippodrome", {}).get("libelleLong", "?")
@@ -201,12 +245,14 @@ def process_date(date_str):
                 continue
 
             for p in part_data["participants"]:
-                numPmu = p.get("numPmu")
                 nom_h = p.get("nom")
                 age = p.get("age")
                 sexe = p.get("sexe")
 
-                horse_db_id = get_or_create_horse(numPmu, nom_h, age, sexe)
+                horse_db_id = get_or_create_horse(
+                    nom_h, age, sexe, date_str,
+                    p.get("nomPere"), p.get("nomMere"), p.get("proprietaire"), p.get("eleveur")
+                )
 
                 name_trainer = safe_name(p.get("entraineur"))
                 trainer_db_id = get_or_create_trainer(name_trainer)
@@ -235,18 +281,36 @@ def process_date(date_str):
     time.sleep(SLEEP_BASE * 2)
 
 
-def main():
-    # reprise automatique
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import des courses PMU dans la BD v1")
+    parser.add_argument("--db", default=DB_NAME, help=f"fichier SQLite (défaut : {DB_NAME})")
+    parser.add_argument("--base", default=BASE, help="URL de base de l'API PMU")
+    parser.add_argument("--start", default=None,
+                        help="première date (ddmmyyyy) ; prioritaire sur la reprise automatique")
+    parser.add_argument("--end", default=END_DATE.strftime("%d%m%Y"), help="dernière date (ddmmyyyy)")
+    args = parser.parse_args(argv)
+
+    configure(args.db, args.base)
+    end_date = datetime.strptime(args.end, "%d%m%Y")
+    conn = get_conn()
+    cur = conn.cursor()
+
+    # reprise automatique, sauf si --start est donné explicitement
     cur.execute("SELECT last_date FROM progress WHERE id = 1")
     row = cur.fetchone()
-    if row and row[0]:
+    if args.start:
+        d = datetime.strptime(args.start, "%d%m%Y")
+        if row and row[0]:
+            print(f"[WARN] --start donné : reprise du {row[0]} ignorée")
+        print(f"Démarrage depuis le {d.strftime('%d/%m/%Y')}")
+    elif row and row[0]:
         d = datetime.strptime(row[0], "%d%m%Y") + timedelta(days=1)
         print(f"Reprise depuis le {d.strftime('%d/%m/%Y')}")
     else:
         d = START_DATE
         print(f"Démarrage depuis le {START_DATE.strftime('%d/%m/%Y')}")
 
-    while d <= END_DATE:
+    while d <= end_date:
         date_str = d.strftime("%d%m%Y")
         process_date(date_str)
 
@@ -255,7 +319,7 @@ def main():
         conn.commit()
 
         d += timedelta(days=1)
-    conn.close()
+    close()
     print("Import complet terminé ✅")
 
 if __name__ == "__main__":
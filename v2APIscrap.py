@@ -1,89 +1,53 @@
+import argparse
+import os
 import requests
 import sqlite3
 import time
 from datetime import datetime, timedelta
 
+from horseIdentity import load_horse_index, resolve_horse
+from schemaV2 import SCHEMA, upgrade_horses
+
 BASE = "https://offline.turfinfo.api.pmu.fr/rest/client/1"
 DB_FILE = "pmu.sqlite"
 
 # Delai de base pour API calls
 BASE_SLEEP = 0.01
 
-conn = sqlite3.connect(DB_FILE)
-cur = conn.cursor()
-
-# -------------------- CREATE TABLES -------------------- #
-cur.executescript("""
-CREATE TABLE IF NOT EXISTS hippodromes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    code TEXT UNIQUE,
-    libelleCourt TEXT,
-    libelleLong TEXT
-);
-
-CREATE TABLE IF NOT EXISTS courses (
-    course_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    date TEXT,
-    categorie TEXT,
-    course_externe TEXT,
-    libelle TEXT,
-    hippodrome_id INTEGER,
-    terrain_id INTEGER,
-    discipline TEXT,
-    specialite TEXT,
-    distance INTEGER,
-    heure_depart INTEGER,
-    duree INTEGER,
-    nombre_declares INTEGER,
-    FOREIGN KEY(hippodrome_id) REFERENCES hippodromes(id)
-    FOREIGN KEY(terrain_id) REFERENCES terrain(id)
-);
-
-CREATE TABLE IF NOT EXISTS horses (
-    horse_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nom TEXT UNIQUE,
-    age INTEGER,
-    sexe TEXT
-);
-
-CREATE TABLE IF NOT EXISTS trainers (
-    trainer_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nom TEXT UNIQUE
-);
-
-CREATE TABLE IF NOT EXISTS drivers (
-    driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nom TEXT UNIQUE
-);
-
-CREATE TABLE IF NOT EXISTS terrain (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    type TEXT,
-    etat TEXT
-);
-
-CREATE TABLE IF NOT EXISTS participants (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    course_id INTEGER,
-    horse_id INTEGER,
-    trainer_id INTEGER,
-    driver_id INTEGER,
-    ordreArrivee INTEGER,
-    temps INTEGER,
-    rapport_direct REAL,
-    rapport_ref REAL,
-    courses_courues INTEGER,
-    courses_gagnees INTEGER,
-    courses_placees INTEGER,
-    distance_reelle INTEGER,
-    disqualifie BOOLEAN,
-    FOREIGN KEY(course_id) REFERENCES courses(course_id),
-    FOREIGN KEY(horse_id) REFERENCES horses(horse_id),
-    FOREIGN KEY(trainer_id) REFERENCES trainers(trainer_id),
-    FOREIGN KEY(driver_id) REFERENCES drivers(driver_id)
-);
-""")
-conn.commit()
+# -------------------- CONNEXION -------------------- #
+# Ouverte au premier accès (et non à l'import) : une connexion par process,
+# les workers qui importent ce module ouvrent donc chacun la leur.
+_conn = None
+_conn_pid = None
+_horses = None  # index des chevaux en mémoire, chargé au premier get_or_create_horse
+
+def configure(db_file=None, base=None):
+    """Change la BD et/ou l'URL de l'API avant utilisation (ferme la connexion courante)."""
+    global DB_FILE, BASE
+    if db_file is not None and db_file != DB_FILE:
+        close()
+        DB_FILE = db_file
+    if base is not None:
+        BASE = base
+
+def get_conn():
+    global _conn, _conn_pid, _horses
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = sqlite3.connect(DB_FILE)
+        _conn.executescript(SCHEMA)
+        upgrade_horses(_conn)
+        _conn.commit()
+        _conn_pid = os.getpid()
+        _horses = None
+    return _conn
+
+def close():
+    global _conn, _conn_pid, _horses
+    if _conn is not None and _conn_pid == os.getpid():
+        _conn.close()
+    _conn = None
+    _conn_pid = None
+    _horses = None
 
 # -------------------- HELPERS -------------------- #
 def safe_get(url):
@@ -98,20 +62,20 @@ def safe_get(url):
         print(f"[EXCEPTION] {url} -> {e}")
         return None
 
-def get_or_create_horse(nom, age, sexe):
+def get_or_create_horse(nom, age, sexe, date_str=None, pere=None, mere=None,
+                        proprietaire=None, eleveur=None):
+    global _horses
     if not nom:  # sécurité
         return None
-    cur.execute("SELECT horse_id FROM horses WHERE nom=?", (nom,))
-    res = cur.fetchone()
-    if res:
-        return res[0]
-    cur.execute("INSERT INTO horses (nom, age, sexe) VALUES (?, ?, ?)",
-                (nom, age, sexe))
-    conn.commit()
-    return cur.lastrowid
+    conn = get_conn()
+    if _horses is None:
+        _horses = load_horse_index(conn)
+    return resolve_horse(conn, _horses, nom, age, sexe, date_str, pere, mere, proprietaire, eleveur)
 
 
 def get_or_create_trainer(nom):
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT trainer_id FROM trainers WHERE nom=?", (nom,))
     res = cur.fetchone()
     if res:
@@ -121,6 +85,8 @@ def get_or_create_trainer(nom):
     return cur.lastrowid
 
 def get_or_create_driver(nom):
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT driver_id FROM drivers WHERE nom=?", (nom,))
     res = cur.fetchone()
     if res:
@@ -130,10 +96,20 @@ def get_or_create_driver(nom):
     return cur.lastrowid
 
 def get_or_create_hippodrome(code, libCourt, libLong):
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT id FROM hippodromes WHERE code=?", (code,))
     res = cur.fetchone()
     if res:
         return res[0]
+    # hippodrome migré depuis v1 (sans code) : on lui donne son code plutôt que d'en créer un second
+    cur.execute("SELECT MIN(id) FROM hippodromes WHERE code IS NULL AND upper(libelleLong)=upper(?)",
+                (libLong,))
+    res = cur.fetchone()
+    if res[0] is not None and code is not None:
+        cur.execute("UPDATE hippodromes SET code=?, libelleCourt=? WHERE id=?", (code, libCourt, res[0]))
+        conn.commit()
+        return res[0]
     cur.execute("INSERT INTO hippodromes (code, libelleCourt, libelleLong) VALUES (?, ?, ?)",
                 (code, libCourt, libLong))
     conn.commit()
@@ -141,12 +117,16 @@ def get_or_create_hippodrome(code, libCourt, libLong):
 
 
 def get_hippodrome(id):
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT * FROM hippodromes WHERE id=?", (id,))
     res = cur.fetchone()
     if res:
         return res
 
 def get_or_create_terrain(type, etat):
+    conn = get_conn()
+    cur = conn.cursor()
     cur.execute("SELECT id FROM terrain WHERE type=? AND etat=?", (type, etat))
     res = cur.fetchone()
     if res:
@@ -171,6 +151,9 @@ def process_date(date_str):
         print(f"[NO REUNION] {date_str} : aucune réunion trouvée")
         return
 
+    conn = get_conn()
+    cur = conn.cursor()
+
     for reunion in reunions:
         numR = f"{reunion['numOfficiel']}"
         hippo = reunion.get("hippodrome", {})
@@ -246,7 +229,10 @@ def process_date(date_str):
                 continue
 
             for p in p_data.get("participants", []):
-                horse_id = get_or_create_horse(p.get("nom"), p.get("age"), p.get("sexe"))
+                horse_id = get_or_create_horse(
+                    p.get("nom"), p.get("age"), p.get("sexe"), date_str,
+                    p.get("nomPere"), p.get("nomMere"), p.get("proprietaire"), p.get("eleveur")
+                )
                 trainer_id = get_or_create_trainer(p.get("entraineur"))
                 driver_id = get_or_create_driver(p.get("driver"))
 
@@ -279,9 +265,20 @@ def process_date(date_str):
             time.sleep(BASE_SLEEP)
 
 # -------------------- LOOP OVER DATES -------------------- #
-def main():
-    start_date = datetime(2020, 1, 1)
-    end_date = datetime.now() - timedelta(days=1)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import des courses PMU dans la BD v2")
+    parser.add_argument("--db", default=DB_FILE, help=f"fichier SQLite (défaut : {DB_FILE})")
+    parser.add_argument("--base", default=BASE, help="URL de base de l'API PMU")
+    parser.add_argument("--start", default="01012020", help="première date (ddmmyyyy)")
+    parser.add_argument("--end", default=None, help="dernière date (ddmmyyyy, défaut : hier)")
+    args = parser.parse_args(argv)
+
+    configure(args.db, args.base)
+    start_date = datetime.strptime(args.start, "%d%m%Y")
+    if args.end:
+        end_date = datetime.strptime(args.end, "%d%m%Y")
+    else:
+        end_date = datetime.now() - timedelta(days=1)
 
     delta = timedelta(days=1)
     current = start_date
@@ -290,6 +287,7 @@ def main():
         process_date(date_str)
         time.sleep(BASE_SLEEP * 2)  # délai plus long entre les jours
         current += delta
+    close()
 
 if __name__ == "__main__":
     main()